@@ -0,0 +1,422 @@
+"""
+Structured data collectors for NetSQL.
+
+A command in command_definitions.json is normally collected as CLI text through Netmiko and parsed with TextFSM.
+If a command definition has a "collector" section, the data is collected with a structured protocol instead
+(SNMP GETBULK, RESTCONF JSON or NETCONF XML) and mapped directly into the command's headers, skipping TextFSM.
+
+Each collector is a function registered in COLLECTORS, it takes the collector definition, Netmiko device dictionary
+and collector options, and returns a list of rows, one value per header.
+Protocol libraries (pysnmp, ncclient) are optional and only imported when the collector is used.
+"""
+from __future__ import print_function, unicode_literals
+
+import base64
+import json
+import re
+import ssl
+import urllib.request
+import xml.etree.ElementTree as ET
+
+INDEX_COLUMN = "@index"
+VLAN_COLUMN = "@vlan"
+
+# Cisco reserved VLANs (FDDI and Token Ring defaults), they have no bridge tables
+RESERVED_VLANS = ("1002", "1003", "1004", "1005")
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def format_mac(value):
+    """
+    Converts a MAC address to Cisco format, so it matches CLI output and can be used to join dataframes
+
+    :param value: MAC address as SNMP hex string (0xaabbccddeeff), table index (170.187.204.221.238.255)
+                  or colon separated string (aa:bb:cc:dd:ee:ff)
+    :return: MAC address as aabb.ccdd.eeff, or the original value if it is not recognised
+    """
+    value = value.strip()
+    if re.fullmatch(r"(\d{1,3}\.){5}\d{1,3}", value):
+        octets = "".join("{:02x}".format(int(item)) for item in value.split("."))
+    elif value.lower().startswith("0x"):
+        octets = value[2:].lower()
+    else:
+        octets = re.sub(r"[:\-\.]", "", value).lower()
+
+    if not re.fullmatch(r"[0-9a-f]{12}", octets):
+        return value
+    return ".".join(octets[i:i + 4] for i in range(0, 12, 4))
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def normalise_column(column):
+    """
+    Column definitions can be a plain string (OID or path) or a dictionary with extra options
+
+    :param column: column definition from command_definitions.json
+    :return: dictionary
+    """
+    if isinstance(column, dict):
+        return column
+    return {"source": column}
+
+
+def format_value(value, column):
+    """
+    Applies "map" and "format" options of a column definition to a collected value
+
+    :param value: collected value as string, or bytes for SNMP OctetString values
+    :param column: normalised column definition
+    :return: formatted value
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        if column.get("format") == "mac":
+            value = value.hex()
+        else:
+            try:
+                value = value.decode("utf-8")
+            except UnicodeDecodeError:
+                value = "0x" + value.hex()
+    value = str(value)
+    if "map" in column:
+        value = column["map"].get(value, value)
+    if column.get("format") == "mac":
+        value = format_mac(value)
+    return value
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def rows_from_snmp_tables(headers, columns, tables, vlan=""):
+    """
+    Builds rows from walked SNMP table columns.
+
+    :param headers: CSV headers, defines the order of values in each row
+    :param columns: dictionary, header -> column definition, for example:
+                    {"Interface": {"source": "1.3.6.1.2.1.2.2.1.1", "lookup": ["1.3.6.1.2.1.31.1.1.1.1"]},
+                     "MAC": {"source": "@index", "format": "mac"}}
+                    "@index" takes the value from the table row index, "@vlan" takes the VLAN the tables were walked in.
+                    "lookup" is a chain of tables, the value is used as an index in each table in turn,
+                    for example bridge port -> ifIndex -> ifName
+    :param tables: dictionary, OID -> {index: value}, already walked
+    :param vlan: VLAN ID, if the tables were walked in a VLAN context
+    :return: list of rows
+    """
+    normalised = {header: normalise_column(columns.get(header, "")) for header in headers}
+
+    # Table rows are defined by the indexes of the first walked column
+    indexes = []
+    for header in headers:
+        source = normalised[header]["source"]
+        if source and source not in (INDEX_COLUMN, VLAN_COLUMN):
+            indexes = list(tables.get(source, {}).keys())
+            break
+
+    rows = []
+    for index in indexes:
+        row = []
+        for header in headers:
+            column = normalised[header]
+            source = column["source"]
+            if not source:
+                value = ""
+            elif source == INDEX_COLUMN:
+                value = index
+            elif source == VLAN_COLUMN:
+                value = vlan
+            else:
+                value = tables.get(source, {}).get(index)
+            for lookup_oid in column.get("lookup", []):
+                if value is None:
+                    break
+                value = tables.get(lookup_oid, {}).get(str(value), value)
+            row.append(format_value(value, column))
+        rows.append(row)
+    return rows
+
+
+def snmp_walk(engine, auth, target, oid, max_repetitions):
+    """
+    Walks a single SNMP table column with GETBULK requests
+
+    :return: dictionary, index suffix -> value as string, or bytes for OctetString values
+    """
+    from pysnmp.hlapi import bulkCmd, ContextData, ObjectType, ObjectIdentity, OctetString, IpAddress
+    from pysnmp.proto.rfc1905 import EndOfMibView, NoSuchInstance, NoSuchObject
+
+    result = {}
+    for error_indication, error_status, error_index, var_binds in bulkCmd(
+        engine,
+        auth,
+        target,
+        ContextData(),
+        0,
+        max_repetitions,
+        ObjectType(ObjectIdentity(oid)),
+        lexicographicMode=False,
+    ):
+        if error_indication:
+            raise RuntimeError(str(error_indication))
+        if error_status:
+            raise RuntimeError(error_status.prettyPrint())
+        for name, value in var_binds:
+            # the table is the last one the agent has, or it doesn't exist
+            if isinstance(value, (EndOfMibView, NoSuchInstance, NoSuchObject)):
+                continue
+            # prettyPrint shows OctetString as text if all bytes are printable, which breaks binary values like MACs,
+            # keep raw bytes and let format_value decide. IpAddress is an OctetString too, but prints as dotted address
+            if isinstance(value, OctetString) and not isinstance(value, IpAddress):
+                value = value.asOctets()
+            else:
+                value = value.prettyPrint()
+            result[str(name)[len(oid) + 1:]] = value
+    return result
+
+
+def collect_snmp(definition, a_device, collector_options):
+    """
+    Collects SNMP tables (ifTable, dot1dTpFdbTable, ipNetToMediaTable, etc) with GETBULK
+
+    Cisco IOS keeps a separate BRIDGE-MIB instance for every VLAN, accessed with community@vlan.
+    If the definition has "vlans" (OID of the VLAN list, such as vtpVlanState), tables listed in "vlan_tables"
+    are walked once per operational VLAN with community@vlan, other tables are walked once with the community.
+
+    :param definition: collector definition, for example:
+                       {"type": "snmp", "port": 161, "max_repetitions": 50, "columns": {...}}
+                       {"type": "snmp", "vlans": "1.3.6.1.4.1.9.9.46.1.3.1.1.2",
+                        "vlan_tables": ["1.3.6.1.2.1.17.4.3.1.1", ...], "columns": {...}}
+    :param a_device: Dictionary - Netmiko device format
+    :param collector_options: dictionary with "snmp_community"
+    :return: list of rows
+    """
+    try:
+        from pysnmp.hlapi import SnmpEngine, CommunityData, UdpTransportTarget
+    except ImportError:
+        raise RuntimeError("SNMP collector requires pysnmp, install it with: pip install pysnmp")
+
+    engine = SnmpEngine()
+    community = collector_options.get("snmp_community", "public")
+    auth = CommunityData(community)
+    target = UdpTransportTarget(
+        (a_device["host"], definition.get("port", 161)),
+        timeout=definition.get("timeout", 2),
+        retries=definition.get("retries", 1),
+    )
+    max_repetitions = definition.get("max_repetitions", 50)
+
+    # Walk every OID referenced by the columns only once
+    oids = []
+    for column in definition["columns"].values():
+        column = normalise_column(column)
+        for oid in [column["source"]] + column.get("lookup", []):
+            if oid and oid not in (INDEX_COLUMN, VLAN_COLUMN) and oid not in oids:
+                oids.append(oid)
+
+    if "vlans" not in definition:
+        tables = {oid: snmp_walk(engine, auth, target, oid, max_repetitions) for oid in oids}
+        return rows_from_snmp_tables(definition["headers"], definition["columns"], tables)
+
+    vlan_tables = definition.get("vlan_tables", [])
+    tables = {
+        oid: snmp_walk(engine, auth, target, oid, max_repetitions) for oid in oids if oid not in vlan_tables
+    }
+    # VLAN list index ends with the VLAN ID, such as <domain>.<vlan> for vtpVlanState, 1 is operational
+    vlan_states = snmp_walk(engine, auth, target, definition["vlans"], max_repetitions)
+    vlans = [index.split(".")[-1] for index, state in vlan_states.items() if state == "1"]
+
+    rows = []
+    for vlan in vlans:
+        if vlan in RESERVED_VLANS:
+            continue
+        vlan_auth = CommunityData(community + "@" + vlan)
+        for oid in oids:
+            if oid in vlan_tables:
+                tables[oid] = snmp_walk(engine, vlan_auth, target, oid, max_repetitions)
+        rows.extend(rows_from_snmp_tables(definition["headers"], definition["columns"], tables, vlan))
+    return rows
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def get_path(item, path):
+    """
+    Gets a value from nested JSON dictionaries using a path separated with /
+
+    :param item: dictionary
+    :param path: path, for example "statistics/in-errors"
+    :return: value or None
+    """
+    for key in path.split("/"):
+        if not isinstance(item, dict) or key not in item:
+            return None
+        item = item[key]
+    return item
+
+
+def rows_from_json(headers, columns, records_path, data):
+    """
+    Builds rows from RESTCONF JSON data
+
+    :param headers: CSV headers
+    :param columns: dictionary, header -> path inside each record, for example {"Input_Errors": "statistics/in-errors"}
+    :param records_path: path to the list of records, for example "ietf-interfaces:interfaces-state/interface"
+    :param data: decoded JSON
+    :return: list of rows
+    """
+    records = get_path(data, records_path) if records_path else data
+    if records is None:
+        return []
+    if isinstance(records, dict):
+        records = [records]
+
+    normalised = {header: normalise_column(columns.get(header, "")) for header in headers}
+    rows = []
+    for record in records:
+        row = []
+        for header in headers:
+            column = normalised[header]
+            value = get_path(record, column["source"]) if column["source"] else ""
+            row.append(format_value(value, column))
+        rows.append(row)
+    return rows
+
+
+def collect_restconf(definition, a_device, collector_options):
+    """
+    Collects data with RESTCONF GET request, JSON encoding
+
+    :param definition: collector definition, for example:
+                       {"type": "restconf", "path": "/restconf/data/ietf-interfaces:interfaces-state",
+                        "records": "ietf-interfaces:interfaces-state/interface", "columns": {...}}
+                       Certificates are verified unless the definition has "verify": false
+    :param a_device: Dictionary - Netmiko device format
+    :param collector_options: dictionary with "verify_certificates", False disables verification for all devices
+    :return: list of rows
+    """
+    scheme = definition.get("scheme", "https")
+    url = "{}://{}:{}{}".format(
+        scheme, a_device["host"], definition.get("port", 443 if scheme == "https" else 80), definition["path"]
+    )
+    credentials = base64.b64encode((a_device["username"] + ":" + a_device["password"]).encode()).decode()
+    request = urllib.request.Request(
+        url,
+        headers={"Accept": "application/yang-data+json", "Authorization": "Basic " + credentials},
+    )
+
+    context = None
+    verify = definition.get("verify", True) and collector_options.get("verify_certificates", True)
+    if scheme == "https" and not verify:
+        # username and password are sent with every request, warn that the device is not authenticated
+        print(
+            " ===> WARNING : Certificate verification is disabled for: {}, credentials are sent to an "
+            "unverified device".format(a_device["host"])
+        )
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+    with urllib.request.urlopen(request, timeout=definition.get("timeout", 30), context=context) as response:
+        data = json.loads(response.read().decode())
+    return rows_from_json(definition["headers"], definition["columns"], definition.get("records", ""), data)
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def strip_namespaces(root):
+    """
+    Removes XML namespaces from element tags, so paths in command_definitions.json can use local names only
+    """
+    for element in root.iter():
+        if isinstance(element.tag, str) and "}" in element.tag:
+            element.tag = element.tag.split("}", 1)[1]
+    return root
+
+
+def rows_from_xml(headers, columns, records_path, xml_text):
+    """
+    Builds rows from NETCONF XML data
+
+    :param headers: CSV headers
+    :param columns: dictionary, header -> path inside each record, for example {"Input_Errors": "statistics/in-errors"}
+    :param records_path: path to the records, for example "interfaces-state/interface"
+    :param xml_text: XML reply data
+    :return: list of rows
+    """
+    root = strip_namespaces(ET.fromstring(xml_text))
+    normalised = {header: normalise_column(columns.get(header, "")) for header in headers}
+
+    rows = []
+    for record in root.iterfind(".//" + records_path):
+        row = []
+        for header in headers:
+            column = normalised[header]
+            value = record.findtext(column["source"]) if column["source"] else ""
+            row.append(format_value(value.strip() if value else value, column))
+        rows.append(row)
+    return rows
+
+
+def collect_netconf(definition, a_device, collector_options):
+    """
+    Collects data with NETCONF <get> request and subtree filter
+
+    :param definition: collector definition, for example:
+                       {"type": "netconf", "filter": "<interfaces-state xmlns=...>",
+                        "records": "interfaces-state/interface", "columns": {...}}
+    :param a_device: Dictionary - Netmiko device format
+    :param collector_options: not used
+    :return: list of rows
+    """
+    try:
+        from ncclient import manager
+    except ImportError:
+        raise RuntimeError("NETCONF collector requires ncclient, install it with: pip install ncclient")
+
+    with manager.connect(
+        host=a_device["host"],
+        port=definition.get("port", 830),
+        username=a_device["username"],
+        password=a_device["password"],
+        hostkey_verify=False,
+        look_for_keys=False,
+        allow_agent=False,
+        timeout=definition.get("timeout", 30),
+    ) as connection:
+        reply = connection.get(filter=("subtree", definition["filter"]))
+    return rows_from_xml(definition["headers"], definition["columns"], definition["records"], reply.data_xml)
+
+
+# -------------------------------------------------------------------------------------------
+
+# Add new collectors here, the key is used as "type" in the "collector" section of command_definitions.json
+COLLECTORS = {
+    "snmp": collect_snmp,
+    "restconf": collect_restconf,
+    "netconf": collect_netconf,
+}
+
+
+def collect(command_definition, a_device, collector_options):
+    """
+    Runs the collector defined for a command
+
+    :param command_definition: command dictionary from command_definitions.json with "collector" section
+    :param a_device: Dictionary - Netmiko device format
+    :param collector_options: dictionary with collector specific CLI options, such as SNMP community
+    :return: list of rows matching command headers
+    """
+    definition = dict(command_definition["collector"])
+    definition["headers"] = command_definition["headers"]
+    try:
+        collector = COLLECTORS[definition["type"]]
+    except KeyError:
+        raise RuntimeError("Unknown collector type: " + str(definition.get("type")))
+    return collector(definition, a_device, collector_options)
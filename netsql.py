@@ -5,11 +5,15 @@ Requires access to network devices, but also can process raw command output.
 from __future__ import print_function, unicode_literals
 
 import json
+import locale
+import operator
 import re
 import csv
 import getpass
 import ipaddress
 import argparse
+import itertools
+import mmap
 import sys
 
 import numpy
@@ -24,9 +28,43 @@ from netmiko.ssh_exception import (
 )
 from colorama import init, Fore, Style
 
+import collectors
+import route_table
+
 DEVICE_TYPE = "cisco_ios"
 REPORT_DIR = "reports\\"
 RAW_OUTPUT_DIR = "raw_data\\"
+# Command with routing table output, used for route lookups
+ROUTE_COMMAND = "show ip route"
+
+# Raw output is parsed in chunks of about PARSE_CHUNK_SIZE bytes and written to CSV in batches of PARSE_BATCH_SIZE rows
+PARSE_CHUNK_SIZE = 1024 * 1024
+PARSE_BATCH_SIZE = 10000
+# Raw output files are written in text mode with the default encoding
+RAW_OUTPUT_ENCODING = locale.getpreferredencoding(False)
+
+# Strings to replace to match different command output, applied in order
+NORMALISE_PATTERNS = [
+    (re.compile(r"(TenGigabitEthernet)(\d{1})\/(\d{1})\/(\d{1,2})"), r"TenGi\2/\3/\4"),
+    (re.compile(r"(GigabitEthernet)(\d{1})\/(\d{1})\/(\d{1,2})"), r"Gi\2/\3/\4"),
+    (re.compile(r"(Te)(\d{1})\/(\d{1})\/(\d{1,2})"), r"TenGi\2/\3/\4"),
+]
+
+# Cisco uptime and last input/output formats: 1y2w, 1w2d, 2d03h, and 00:01:23 for less than a day
+DURATION_REGEX = r"^(?:(?P<y>\d+)y)?(?:(?P<w>\d+)w)?(?:(?P<d>\d+)d)?(?:(?P<h>\d+)h)?(?:(?P<m>\d+)m)?(?:(?P<s>\d+)s)?$"
+CLOCK_REGEX = r"^(?P<h>\d+):(?P<m>\d{1,2}):(?P<s>\d{1,2})$"
+DURATION_UNITS = {"y": 365 * 86400, "w": 7 * 86400, "d": 86400, "h": 3600, "m": 60, "s": 1}
+# Typed copies of columns used for numeric conditions, removed before writing reports
+TYPED_COLUMN_PREFIX = "_typed_"
+
+COMPARISON_OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
 
 
 class CustomParser(argparse.ArgumentParser):
@@ -46,6 +84,7 @@ class CustomParser(argparse.ArgumentParser):
             + "\n\n Query should be in the following format: "
             + '\n     -query="select <fields to select or * > from <source> where <condition>"'
             + "\n     <fields to select or * >  and <source>  are required, <condition> is onptional "
+            + "\n     <condition> operators: = (substring, or exact value for numeric fields), !=, >, >=, <, <= "
             + "\n\n Query examples: "
             + "\n   - List ports which never been used:"
             + '\n         --query="select * from interfaces where Last_Input = never"'
@@ -59,6 +98,8 @@ class CustomParser(argparse.ArgumentParser):
             + '\n         --query="select Host,Management_ip,Platform,Remote_Port,Local_port from neighbours"'
             + "\n   - Get number of Polcycom devices in building:"
             + '\n         --query="select * from neighbours where Platform=Polycom"'
+            + "\n   - Ports with input errors, idle for more than 30 days:"
+            + '\n         --query="select * from interfaces where Input_Errors > 0 and Last_Input > 30d"'
         )
         print("\n The following data sources are allowed in queries: \n")
 
@@ -132,6 +173,36 @@ def parse_args(args=sys.argv[1:]):
         action="store_true",
         help="Prints report to HTML. CVS reports are always generated",
     )
+    optional.add_argument(
+        "--snmp-community",
+        default="public",
+        required=False,
+        help="SNMP community for commands collected with SNMP. Default is public",
+    )
+    optional.add_argument(
+        "--no-verify-certificates",
+        default=False,
+        action="store_true",
+        help="Don't verify RESTCONF certificates, for devices with self-signed certificates. Credentials are sent to"
+        " unverified devices",
+    )
+    optional.add_argument(
+        "--route-lookup",
+        required=False,
+        help="IP address to look up in routing tables of all devices, shows the longest prefix match route and next hop."
+        " Requires routes data source",
+    )
+    optional.add_argument(
+        "--route-reach",
+        required=False,
+        help="Prefix, such as 10.1.2.0/24, shows devices with a route covering it. Requires routes data source",
+    )
+    optional.add_argument(
+        "--route-overlaps",
+        default=False,
+        action="store_true",
+        help="Shows overlapping and shadowed prefixes in routing tables of all devices. Requires routes data source",
+    )
     return parser.parse_args(args)
 
 
@@ -159,6 +230,15 @@ def command_analysis(text):
          'fields': ['*'],
          'source': 'students'}
 
+    Conditions can also use comparison operators !=, >, >=, <, <=, for example:
+
+    select * from interfaces where Input_Errors > 0
+
+        {'conditions': [{'cond_field': 'Input_Errors',
+                         'cond_operator': '>',
+                         'cond_value': '0'}],
+         ...
+
     Written by Ilya Zyuzin, McKinnon Secondary College, 07K. 2019.
     """
     fields = []
@@ -187,21 +267,23 @@ def command_analysis(text):
         try:
             if command[4] == "where":
                 tempcond = " ".join(command[5:])
-                # split conditions by keyword 'and'
-                condition = tempcond.split("and")
+                # split conditions by keyword 'and', whole words only, so fields like Bandwidth are not cut
+                condition = re.split(r"\s+and\s+", tempcond)
                 # loop until everything has been sorted
                 for element in condition:
                     condition_dic = {}
-                    # split every condition by keyword '='
-                    val = element.split("=")
+                    # split every condition by comparison operator, '=' by default
+                    val = re.split(r"(>=|<=|!=|=|>|<)", element, maxsplit=1)
                     condition_dic["cond_field"] = val[0].strip()
+                    condition_dic["cond_operator"] = val[1]
+                    del val[1]
 
                     conditions_list.append(val[0].strip())
 
-                    if "or" in val[1]:
+                    if re.search(r"\s+or\s+", val[1]):
                         # if there is an 'or' in the request
                         tempvalue = ("").join(val[1])
-                        values = tempvalue.split("or")
+                        values = re.split(r"\s+or\s+", tempvalue)
                         condition_dic["cond_value"] = []
                         for value in values:
                             if value != " ":
@@ -237,22 +319,51 @@ def command_analysis(text):
 # -------------------------------------------------------------------------------------------
 
 
-def run_command_and_write_to_txt(commands, a_device, no_connect, get_metadata_items):
+def run_command_and_write_to_txt(commands, a_device, no_connect, get_metadata_items, collector_options):
     """
     Executes IOS commands using Netmiko.
     Writes raw output to a report file.
+    Commands with a structured collector defined are collected with it and written directly to CSV files.
 
     :param commands: list of commands
     :param a_device: device IP
     :param no_connect: whether to connect, if False the script exits without trying to connect
+    :param collector_options: dictionary with collector specific options, such as SNMP community
     :return: False if any errors occurred, otherwise True
     """
 
     # If Do Not Connect flag is set, do not connect to any devices, just return True
-    # The script uses the output .txt files previously collected
+    # The script uses the output .txt and .csv files previously collected
     if no_connect:
         return True
 
+    cli_commands = []
+    for command in commands:
+        command_definition = find_command(command, command_definitions)
+        if not (command_definition and "collector" in command_definition):
+            cli_commands.append(command)
+            continue
+
+        file_name = get_file_path(a_device["host"], command, "raw_output") + ".csv"
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        try:
+            rows = collectors.collect(command_definition, a_device, collector_options)
+        except Exception as error:
+            print(
+                " ===> WARNING : {} collector failed for: {}, error: {}  Skipping.".format(
+                    command_definition["collector"].get("type"), a_device["host"], str(error)
+                )
+            )
+            print("-" * 80)
+            return False
+        if not print_to_csv_file(command_definition["headers"], rows, file_name):
+            print("-" * 80)
+            return False
+
+    # All commands are collected with structured collectors, no need to connect with SSH
+    if not cli_commands:
+        return True
+
     try:
         remote_conn = ConnectHandler(**a_device)
     except NetMikoAuthenticationException as error:
@@ -279,7 +390,7 @@ def run_command_and_write_to_txt(commands, a_device, no_connect, get_metadata_it
         )
     else:
         # no exceptions happened - ssh connection established, OK to run commands
-        for command in commands:
+        for command in cli_commands:
             file_name = get_file_path(a_device["host"], command, "raw_output") + ".txt"
             print("Writing output to file: ", file_name)
             os.makedirs(os.path.dirname(file_name), exist_ok=True)
@@ -346,62 +457,24 @@ def get_file_path(host, command, file_type):
 
 # -------------------------------------------------------------------------------------------
 
-def normalise_file(file_name):
+def normalise_row(row):
     """
     Replaces strings to match different command output, for example, changes all interface names from GigabitEnternet to Gi
-    Add any other normalisation here
+    Add any other normalisation to NORMALISE_PATTERNS
 
-    :param file_name: File Name to load and replace strings
-    :return: none
+    :param row: list of parsed values, a value can be a string or a list of strings
+    :return: normalised row
     """
-    # Issue - when regexes are stored as strings, they are treated as special characters
-    dict = {
-        "(GigabitEthernet)(\d{1})\/(\d{1})\/(\d{1,2})": "Gi\2/\3/\4",
-        "(Te)(\d{1})\/(\d{1})\/(\d{1,2})": "TenGi\2/\3/\4"
-    }
-
-    with open(file_name, "r+") as f:
-        content = f.read()
-
-        # needs to be fixed to read from dict
-        # for key in dict:
-        # print(key)
-        # print(dict[key])
-        # subs = "r"+ "\"" +(dict[key])+ "\""
-        # content_new = re.sub(
-        #     key,
-        #     #r dict[key],
-        #     subs,
-        #     text,
-        #     flags=re.M,
-        # )
-        # text = content_new
-
-        content_new = re.sub(
-            "(TenGigabitEthernet)(\d{1})\/(\d{1})\/(\d{1,2})",
-            r"TenGi\2/\3/\4",
-            content,
-            flags=re.M,
-        )
-        content = content_new
-        content_new = re.sub(
-            "(GigabitEthernet)(\d{1})\/(\d{1})\/(\d{1,2})",
-            r"Gi\2/\3/\4",
-            content,
-            flags=re.M,
-        )
-        content = content_new
-        content_new = re.sub(
-            "(Te)(\d{1})\/(\d{1})\/(\d{1,2})",
-            r"TenGi\2/\3/\4",
-            content,
-            flags=re.M,
-        )
-
-        # rewriting file
-        f.seek(0)
-        f.truncate()
-        f.write(content_new)
+    normalised = []
+    for value in row:
+        if isinstance(value, list):
+            normalised.append(normalise_row(value))
+            continue
+        if isinstance(value, str):
+            for pattern, replacement in NORMALISE_PATTERNS:
+                value = pattern.sub(replacement, value)
+        normalised.append(value)
+    return normalised
 
 
 # -------------------------------------------------------------------------------------------
@@ -412,22 +485,75 @@ def print_to_csv_file(headers, content, file_name):
     Prints text to CSV files, also changes command output where necessary, such as Gi -> GigabitEthernet
 
     :param headers: CSV headers
-    :param content: CSV text
+    :param content: CSV rows, any iterable, rows are written as they come, so it can be a generator
     :param file_name: output file name
-    :return: None
+    :return: False if any errors occurred, otherwise True
     """
+    # content can be a generator which parses output while the file is written, and it can fail halfway,
+    # so write to a temporary file and replace the CSV file only when all rows are written
+    temp_file_name = file_name + ".tmp"
     try:
-        with open(file_name, "w", newline="") as out_csv:
+        with open(temp_file_name, "w", newline="") as out_csv:
             csvwriter = csv.writer(out_csv, delimiter=",")
             csvwriter.writerow(headers)
             for item in content:
-                csvwriter.writerow(item)
-        # Replace strings to match different command output, for example, make all interface names from GigabitEnternet
-        # to Gi
-        normalise_file(file_name)
+                # Replace strings to match different command output, for example, make all interface names
+                # from GigabitEnternet to Gi
+                csvwriter.writerow(normalise_row(item))
+        os.replace(temp_file_name, file_name)
         print("Writing CSV", file_name)
+        return True
     except Exception as e:
-        print("Error while opening file", e)
+        print("Error while writing CSV file", file_name, e)
+        if os.path.exists(temp_file_name):
+            os.remove(temp_file_name)
+        return False
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def parse_raw_output(text_fsm_template, content_file, batch_size=PARSE_BATCH_SIZE, chunk_size=PARSE_CHUNK_SIZE):
+    """
+    Parses raw command output with TextFSM in chunks, yields parsed rows in batches.
+    The file is memory-mapped and only one chunk is decoded at a time, so memory use is bounded by the chunk
+    and batch sizes rather than the output size, which matters for show running-config or show ip route on big devices.
+
+    :param text_fsm_template: TextFSM object
+    :param content_file: raw output file opened in binary mode
+    :param batch_size: number of rows in each batch
+    :param chunk_size: approximate number of bytes passed to TextFSM at once, chunks are aligned to line ends
+    :return: generator of lists of rows
+
+    Relies on TextFSM internals, checked with textfsm 1.1.0:
+     - ParseText returns its internal result list (self._result), not a copy. It accumulates rows across calls,
+       so rows are removed from that same list after each batch, otherwise the next chunk would return them again
+     - _cur_state_name is private, it's the only way to know the template reached End or EOF state
+    test_parse_raw_output_chunks_match_whole_text guards both
+    """
+    size = os.fstat(content_file.fileno()).st_size
+    # empty files can't be memory-mapped
+    if size:
+        with mmap.mmap(content_file.fileno(), 0, access=mmap.ACCESS_READ) as raw_output:
+            position = 0
+            while position < size:
+                end = raw_output.find(b"\n", position + chunk_size)
+                end = size if end < 0 else end + 1
+                # ParseText with eof=False keeps the current state and record between chunks
+                rows = text_fsm_template.ParseText(raw_output[position:end].decode(RAW_OUTPUT_ENCODING), eof=False)
+                position = end
+                while len(rows) >= batch_size:
+                    yield rows[:batch_size]
+                    del rows[:batch_size]
+                # the template reached End state, the rest of the output is ignored, same as parsing the whole text
+                if text_fsm_template._cur_state_name in ("End", "EOF"):
+                    break
+
+    # Trigger EOF, so the last record is added
+    rows = text_fsm_template.ParseText("", eof=True)
+    while rows:
+        yield rows[:batch_size]
+        del rows[:batch_size]
 
 
 # -------------------------------------------------------------------------------------------
@@ -438,80 +564,230 @@ def convert_output_to_csv(commands, a_device):
     Pasres raw test with TextFSM, Converts text file to CSV and writes CSV
     :param commands: List of commands to execute
     :param a_device: Dictionary - Netmiko device format
-    :return: none
+    :return: False if any errors occurred, otherwise True
     """
     for command in commands:
+        # Commands with structured collectors are already written to CSV files, nothing to parse
+        command_definition = find_command(command, command_definitions)
+        if command_definition and "collector" in command_definition:
+            continue
+
         # build file names - directory + host IP + command name + .txt
         file_name = get_file_path(a_device["host"], command, "raw_output") + ".txt"
 
-        # Read the whole file
+        # Open the file, it's parsed in chunks, not read as a whole
         try:
-            with open(file_name, "r") as content_file:
-                raw_command_output = content_file.read()
+            content_file = open(file_name, "rb")
         except Exception as e:
             # Could open file, skip the remaining processing
             print("Error while opening file", e)
             return False
 
-        # Get headers and NTC templates for a given command - should be defined as global variables
-        try:
-            headers = find_command(command, command_definitions)["headers"]
-            template = find_command(command, command_definitions)["template"]
-        except:
-            print("template not yet defined for ", command, " - skipping")
-            continue
-        # Parse raw output with text FSM
-        text_fsm_template = textfsm.TextFSM(open(template))
-        parsed_command_output = text_fsm_template.ParseText(raw_command_output)
-        # print to CSV
-        print_to_csv_file(
-            headers, parsed_command_output, file_name.replace(".txt", ".csv")
-        )
+        with content_file:
+            # Get headers and NTC templates for a given command - should be defined as global variables
+            try:
+                headers = command_definition["headers"]
+                template = command_definition["template"]
+            except:
+                print("template not yet defined for ", command, " - skipping")
+                continue
+            # Parse raw output with text FSM
+            with open(template) as template_file:
+                text_fsm_template = textfsm.TextFSM(template_file)
+            # print to CSV, rows are parsed and written batch by batch
+            # parsing errors, such as TextFSM Error rules or decode errors, skip the device
+            if not print_to_csv_file(
+                headers,
+                itertools.chain.from_iterable(parse_raw_output(text_fsm_template, content_file)),
+                file_name.replace(".txt", ".csv"),
+            ):
+                return False
     return True
 
 
 # -------------------------------------------------------------------------------------------
 
 
+def durations_to_seconds(series):
+    """
+    Converts Cisco durations to seconds, such as Last_Input or route uptime
+
+    :param series: Pandas series with values like never, 1y2w, 1w2d, 2d03h, 00:01:23
+    :return: Pandas float series, never is converted to infinity, unknown formats to NaN
+    """
+    text = series.astype(str).str.strip().str.lower()
+    seconds = pd.Series(numpy.nan, index=series.index)
+
+    units = text.str.extract(DURATION_REGEX).astype(float)
+    matched = units.notna().any(axis=1)
+    total = sum(units[unit].fillna(0) * multiplier for unit, multiplier in DURATION_UNITS.items())
+    seconds[matched] = total[matched]
+
+    clock = text.str.extract(CLOCK_REGEX).astype(float)
+    matched = clock.notna().all(axis=1)
+    total = clock["h"] * 3600 + clock["m"] * 60 + clock["s"]
+    seconds[matched] = total[matched]
+
+    seconds[text == "never"] = numpy.inf
+    return seconds
+
+
+def parse_number(value):
+    """
+    Converts a condition value to a number, so it can be compared with typed columns
+
+    :param value: string, for example 100, 2.5, never, 30d, 1w2d, 00:01:23
+    :return: float, or NaN if the value is not a number or duration
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return durations_to_seconds(pd.Series([value]))[0]
+
+
+def typed_column(series, column_type):
+    """
+    Converts a parsed text column to numbers, so it can be filtered with numeric conditions
+
+    :param series: Pandas series loaded from CSV file
+    :param column_type: type defined in command_definitions.json:
+                        int - the first integer in a value, for example 1000000 from "1000000 Kbit"
+                        float - floating point number
+                        duration - seconds, see durations_to_seconds
+    :return: converted series, or None if the type is unknown
+    """
+    if column_type == "int":
+        return pd.to_numeric(series.astype(str).str.extract(r"(-?\d+)", expand=False), errors="coerce").astype("Int64")
+    if column_type == "float":
+        return pd.to_numeric(series, errors="coerce")
+    if column_type == "duration":
+        return durations_to_seconds(series)
+    return None
+
+
+def add_typed_columns(df, column_types):
+    """
+    Adds typed copies of columns defined in column_types, named with TYPED_COLUMN_PREFIX.
+    Typed copies are used for filtering only, reports keep the original values, such as never or 1w2d
+
+    :param df: Dataframe loaded from CSV file
+    :param column_types: dictionary, column name -> type, see typed_column
+    :return: Dataframe with typed columns added
+    """
+    for column, column_type in column_types.items():
+        if column not in df.columns:
+            continue
+        converted = typed_column(df[column], column_type)
+        if converted is None:
+            print(" ===> WARNING : Unknown type", column_type, "for column", column, " - skipping")
+            continue
+        df[TYPED_COLUMN_PREFIX + column] = converted
+    return df
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def filter_mask(column, cond_operator, cond_value, typed=False):
+    """
+    Builds a boolean mask for a single condition
+
+    = matches a substring and != excludes it, unless the column is typed and the value is a number or duration,
+    then they are exact numeric comparisons.
+    >, >=, <, <= compare numbers, the value must be a number or duration. Empty or non-numeric cells never match
+
+    :param column: Pandas series to filter
+    :param cond_operator: =, !=, >, >=, <, <=
+    :param cond_value: string or list of strings (OR condition)
+    :param typed: whether the column is a typed copy, see add_typed_columns
+    :return: boolean mask
+    """
+    if isinstance(cond_value, list):
+        mask = pd.Series(False, index=column.index)
+        for value in cond_value:
+            mask = mask | filter_mask(column, cond_operator, value, typed)
+        return mask
+
+    number = parse_number(cond_value)
+    is_numeric = pd.api.types.is_numeric_dtype(column)
+
+    if cond_operator in ("=", "!=") and not (typed and is_numeric and not numpy.isnan(number)):
+        # see OR in strings : https://stackoverflow.com/questions/19169649/using-str-contains-in-pandas-with-dataframes
+        mask = column.astype(str).str.contains(cond_value, regex=False)
+        return ~mask if cond_operator == "!=" else mask
+
+    if numpy.isnan(number):
+        raise ValueError("Condition {} {} requires a number or duration".format(cond_operator, cond_value))
+
+    if not is_numeric:
+        column = pd.to_numeric(column, errors="coerce")
+    mask = pd.Series(COMPARISON_OPERATORS[cond_operator](column, number), index=column.index)
+    return (mask.fillna(False) & column.notna()).astype(bool)
+
+
+def check_conditions(conditions):
+    """
+    Checks that conditions with >, >=, <, <= have numeric values
+
+    :param conditions: list of conditions from command_analysis
+    :return: error message, or empty string if all conditions are valid
+    """
+    for condition in conditions:
+        if condition.get("cond_operator", "=") in ("=", "!="):
+            continue
+        values = condition["cond_value"] if isinstance(condition["cond_value"], list) else [condition["cond_value"]]
+        for value in values:
+            if numpy.isnan(parse_number(value)):
+                return "Condition {} {} {} requires a number or duration, for example 100, 30d or 00:01:23".format(
+                    condition["cond_field"], condition["cond_operator"], value
+                )
+    return ""
+
+
+# -------------------------------------------------------------------------------------------
+
+
 def process_csv_files(
-    join_dataframes, common_column, fields_to_select, filter, file1, file2, result_file
+    join_dataframes, common_column, fields_to_select, filter, file1, file2, result_file, column_types=({}, {})
 ):
     """
     Joins two dataframes.
     Input parameters:
          - common_column
          - two csv files to join
+         - column types for each csv file, see add_typed_columns
     Writes raw output to a report file
     """
 
     # If "join_dataframes": true   is source_definition.json
     if join_dataframes:
-        pd1 = pd.read_csv(file1)
-        pd2 = pd.read_csv(file2)
-
-        if fields_to_select[0] == "*":
-            #result_pd = pd.merge(pd1, pd2, on=common_column)
-            result_pd = pd.merge(pd1, pd2, left_on=common_column[0], right_on=common_column[1])
-        else:
-            result_pd = pd.merge(pd1, pd2, left_on=common_column[0], right_on=common_column[1]).filter(fields_to_select)
-            #result_pd = pd.merge(pd1, pd2, left_on=common_column[0], right_on=common_column[1])
-            #result_pd = pd.merge(pd1, pd2, on=common_column).filter(fields_to_select)
+        pd1 = add_typed_columns(pd.read_csv(file1), column_types[0])
+        pd2 = add_typed_columns(pd.read_csv(file2), column_types[1])
+        result_pd = pd.merge(pd1, pd2, left_on=common_column[0], right_on=common_column[1])
     else:
         # If "join_dataframes": false   is source_definition.json
-        pd1 = pd.read_csv(file1)
-        if fields_to_select[0] == "*":
-            result_pd = pd1
-        else:
-            result_pd = pd1.filter(fields_to_select)
+        result_pd = add_typed_columns(pd.read_csv(file1), column_types[0])
 
-    # see OR in strings : https://stackoverflow.com/questions/19169649/using-str-contains-in-pandas-with-dataframes
+    # Filter before selecting fields. Typed copies of columns are used where they exist and the value is a number
+    # or duration, other values are matched against the original text, such as Last_Input = 00:01
     if filter:
         for filter_item in filter:
-            result_pd = result_pd[
-                result_pd[filter_item["cond_field"]]
-                .astype(str)
-                .str.contains(filter_item["cond_value"], regex=False)
-            ]
+            field = filter_item["cond_field"]
+            typed_field = TYPED_COLUMN_PREFIX + field
+            values = filter_item["cond_value"]
+            if not isinstance(values, list):
+                values = [values]
+            mask = pd.Series(False, index=result_pd.index)
+            for value in values:
+                typed = typed_field in result_pd.columns and not numpy.isnan(parse_number(value))
+                mask = mask | filter_mask(
+                    result_pd[typed_field if typed else field], filter_item.get("cond_operator", "="), value, typed
+                )
+            result_pd = result_pd[mask]
+
+    result_pd = result_pd[[column for column in result_pd.columns if not column.startswith(TYPED_COLUMN_PREFIX)]]
+    if fields_to_select[0] != "*":
+        result_pd = result_pd.filter(fields_to_select)
 
     # Debug -print(result_file)
     os.makedirs(os.path.dirname(result_file), exist_ok=True)
@@ -520,6 +796,58 @@ def process_csv_files(
 
 # -------------------------------------------------------------------------------------------
 
+
+def process_route_queries(options, hosts, screen_row_count):
+    """
+    Loads routing tables of all processed devices and runs route lookups defined in CLI options.
+    Writes results to report files
+
+    :param options: CLI options
+    :param hosts: list of processed device IPs
+    :param screen_row_count: number of lines printed to screen
+    :return: None
+    """
+    route_tables = {}
+    for host in hosts:
+        file_name = get_file_path(host, ROUTE_COMMAND, "raw_output") + ".csv"
+        try:
+            route_tables[host] = route_table.RouteTable.from_csv(file_name)
+        except Exception as e:
+            print(" ===> WARNING : Could not load routing table", file_name, e)
+
+    queries = []
+    if options.route_lookup:
+        queries.append(("Route lookup for " + options.route_lookup, "route-lookup_report",
+                        lambda: route_table.lookup_devices(route_tables, options.route_lookup)))
+    if options.route_reach:
+        queries.append(("Devices reaching " + options.route_reach, "route-reach_report",
+                        lambda: route_table.devices_reaching(route_tables, options.route_reach)))
+    if options.route_overlaps:
+        queries.append(("Overlapping and shadowed prefixes", "route-overlaps_report",
+                        lambda: route_table.overlapping_prefixes(route_tables)))
+
+    for title, report_file_name, query in queries:
+        try:
+            result_pd = query()
+        except ValueError as e:
+            print(Fore.RED + "Invalid route query:", e)
+            print(Style.RESET_ALL)
+            continue
+
+        result_file = get_file_path("", report_file_name, "report") + ".csv"
+        os.makedirs(os.path.dirname(result_file), exist_ok=True)
+        result_pd.to_csv(result_file)
+
+        print(title, "in", len(route_tables), "routing table(s), results saved as:", result_file)
+        if options.screen_output:
+            print(result_pd.head(screen_row_count))
+            print(Fore.GREEN + "Returned", len(result_pd), "record(s)")
+            print(Style.RESET_ALL)
+        print("-" * 80)
+
+
+# -------------------------------------------------------------------------------------------
+
 # placeholder for Pytest
 def test_case1():
     assert True
@@ -546,6 +874,7 @@ def main():
     number_of_processed_devices = 0
     html_string = ""
     device_ip_addresses = []
+    processed_hosts = []
     commands = ""
 
     screen_row_count = options.screen_lines
@@ -590,6 +919,26 @@ def main():
 
     fields_to_select = query_processed["fields"]
 
+    conditions_error = check_conditions(query_processed["conditions"])
+    if conditions_error:
+        print(conditions_error)
+        exit(1)
+
+    route_queries = options.route_lookup or options.route_reach or options.route_overlaps
+    if route_queries and ROUTE_COMMAND not in commands:
+        print("Route lookups require a data source with", ROUTE_COMMAND, "command, for example: select * from routes")
+        exit(1)
+
+    # Check route query values before connecting to devices
+    try:
+        if options.route_lookup:
+            ipaddress.IPv4Address(options.route_lookup)
+        if options.route_reach:
+            ipaddress.IPv4Network(options.route_reach, strict=False)
+    except ValueError as e:
+        print("Invalid route query:", e)
+        exit(1)
+
     try:
         # if ipaddress.ip_address call didn't fail, it's a valid IP, handle it
         ip_address = str(ipaddress.ip_address(options.source))
@@ -611,6 +960,12 @@ def main():
     # ask for user's password
     password = getpass.getpass(prompt="Password: ", stream=None)
 
+    # options for commands collected with SNMP, RESTCONF or NETCONF
+    collector_options = {
+        "snmp_community": options.snmp_community,
+        "verify_certificates": not options.no_verify_certificates,
+    }
+
     # analyse each line of the source file
     for line in device_ip_addresses:
          # try to convert line into IP address format
@@ -637,7 +992,7 @@ def main():
         get_metadata = {"hostname": "show run | i hostname", "location": "show run | i snmp-server location "}
 
         # Try to get command output from a device
-        if run_command_and_write_to_txt(commands, device, options.no_connect, get_metadata):
+        if run_command_and_write_to_txt(commands, device, options.no_connect, get_metadata, collector_options):
             # Got some output from a device - increase Processed device counter and process the output in txt file
             number_of_processed_devices += 1
 
@@ -649,8 +1004,16 @@ def main():
                 print("-" * 80)
                 continue
 
+            processed_hosts.append(device["host"])
+
             # if process_dataframes flag is set, do not further process output, just keep raw text files
             if process_dataframes:
+                # numeric and duration columns defined for each command
+                column_types = [
+                    (find_command(command, command_definitions) or {}).get("column_types", {})
+                    for command in commands
+                ] + [{}]
+
                 # if join_dataframes flag is set , there are two sources, combine them in a single file
                 if join_dataframes:
                     process_csv_files(
@@ -661,6 +1024,7 @@ def main():
                         get_file_path(device["host"], commands[0], "raw_output") + ".csv",
                         get_file_path(device["host"], commands[1], "raw_output") + ".csv",
                         get_file_path(device["host"], report_file_name, "report") + ".csv",
+                        column_types,
                     )
                 else:
                     # single CVS file, don't join dataframes, only select fields and apply filters
@@ -672,6 +1036,7 @@ def main():
                         get_file_path(device["host"], commands[0], "raw_output") + ".csv",
                         "",
                         get_file_path(device["host"], report_file_name, "report") + ".csv",
+                        column_types,
                     )
 
                 print(
@@ -707,15 +1072,19 @@ def main():
                     # output to HTML
 
                     metadata_output_sting = ""
-                    with open(get_file_path(device["host"], "_metadata", "raw_output") + ".txt", "r") as content_file:
-                        raw_metadata = content_file.readlines()
-                        for line in raw_metadata:
-                            val = line.split(":")
-                            try:
-                                metadata_output_sting = metadata_output_sting + val[1].strip() + "<br>"
-                            except:
-                                # ignore any errors
-                                pass
+                    metadata_file_name = get_file_path(device["host"], "_metadata", "raw_output") + ".txt"
+                    # metadata is collected over SSH only, it doesn't exist for structured collectors
+                    raw_metadata = []
+                    if os.path.exists(metadata_file_name):
+                        with open(metadata_file_name, "r") as content_file:
+                            raw_metadata = content_file.readlines()
+                    for line in raw_metadata:
+                        val = line.split(":")
+                        try:
+                            metadata_output_sting = metadata_output_sting + val[1].strip() + "<br>"
+                        except:
+                            # ignore any errors
+                            pass
 
                     html_string = (
                         html_string
@@ -732,6 +1101,9 @@ def main():
         total_number_of_devices, "devices",
     )
 
+    if route_queries:
+        process_route_queries(options, processed_hosts, screen_row_count)
+
     if options.html_output:
         with open(get_file_path("", report_file_name, "report") + ".html", "w") as f:
             f.write(html_string)
@@ -0,0 +1,229 @@
+"""
+Route table engine for NetSQL.
+
+Loads parsed "show ip route" output of a device into sorted integer interval arrays and answers
+longest prefix match, reachability, and overlapping or shadowed prefix questions without scanning dataframes.
+
+Each unique prefix is an interval [start, end] of IPv4 addresses. Prefixes are sorted by start address and length,
+and each prefix keeps a pointer to its closest covering prefix (parent). A lookup finds the last prefix starting
+at or before the address with a binary search, then follows parent pointers until a prefix contains the address.
+Prefixes never partially overlap, so the walk is bounded by the nesting depth (at most 32).
+"""
+from __future__ import print_function, unicode_literals
+
+import ipaddress
+
+import numpy
+import pandas as pd
+
+OCTET_WEIGHTS = numpy.array([1 << 24, 1 << 16, 1 << 8, 1], dtype=numpy.int64)
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def addresses_to_int(series):
+    """
+    Converts dotted IPv4 addresses to integers
+
+    :param series: Pandas series of strings, such as 10.1.2.0
+    :return: numpy int64 array, -1 for values which are not IPv4 addresses
+    """
+    octets = series.astype(str).str.extract(r"^(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})$").astype(float)
+    valid = octets.notna().all(axis=1).to_numpy() & (octets <= 255).all(axis=1).to_numpy()
+    result = numpy.full(len(series), -1, dtype=numpy.int64)
+    result[valid] = octets.to_numpy()[valid].astype(numpy.int64) @ OCTET_WEIGHTS
+    return result
+
+
+def classful_length(addresses):
+    """
+    Classful prefix length, used when the mask is not known from "is subnetted" line
+
+    :param addresses: numpy int64 array of IPv4 addresses
+    :return: numpy int64 array of prefix lengths
+    """
+    first_octet = addresses >> 24
+    return numpy.select([first_octet < 128, first_octet < 192], [8, 16], default=24).astype(numpy.int64)
+
+
+# -------------------------------------------------------------------------------------------
+
+
+class RouteTable:
+    """
+    Routing table of a single device, built from "show ip route" dataframe or CSV file
+    """
+
+    def __init__(self, routes):
+        """
+        :param routes: dataframe with "show ip route" headers, at least network and mask.
+                       Load-balanced routes are separate rows with the same network and mask.
+        """
+        routes = routes.reset_index(drop=True)
+        networks = addresses_to_int(routes["network"])
+        lengths = pd.to_numeric(routes["mask"], errors="coerce").to_numpy()
+        lengths = numpy.where(numpy.isnan(lengths), classful_length(networks), lengths).astype(numpy.int64)
+
+        valid = (networks >= 0) & (lengths >= 0) & (lengths <= 32)
+        routes, networks, lengths = routes[valid].reset_index(drop=True), networks[valid], lengths[valid]
+
+        # Clear host bits, so every prefix is a proper interval
+        sizes = numpy.left_shift(numpy.int64(1), 32 - lengths)
+        starts = networks - networks % sizes
+
+        # Sort by start address, then by length, so covering prefixes come before the prefixes they cover
+        order = numpy.lexsort((lengths, starts))
+        routes = routes.iloc[order].reset_index(drop=True)
+        routes["mask"] = lengths[order]
+        starts, lengths, sizes = starts[order], lengths[order], sizes[order]
+
+        # One entry per unique prefix, pointing to its first route row and number of routes (ECMP)
+        keys = starts * 64 + lengths
+        unique_rows = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])[:len(keys)]
+
+        self.routes = routes
+        self.starts = starts[unique_rows]
+        self.lengths = lengths[unique_rows]
+        self.sizes = sizes[unique_rows]
+        self.ends = self.starts + self.sizes - 1
+        self.first_row = unique_rows
+        self.row_count = numpy.diff(numpy.r_[unique_rows, len(routes)]).astype(numpy.int64)
+        self.parent = self._build_parents()
+
+    @classmethod
+    def from_csv(cls, file_name):
+        """
+        Loads a routing table from CSV file converted from "show ip route" output
+        """
+        return cls(pd.read_csv(file_name))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _build_parents(self):
+        """
+        Finds the closest covering prefix for every prefix, -1 if there is none
+        """
+        parent = numpy.full(len(self.starts), -1, dtype=numpy.int64)
+        ends = self.ends.tolist()
+        stack = []
+        for index, start in enumerate(self.starts.tolist()):
+            while stack and ends[stack[-1]] < start:
+                stack.pop()
+            if stack:
+                parent[index] = stack[-1]
+            stack.append(index)
+        return parent
+
+    # ---------------------------------------------------------------------------------------
+
+    def match_index(self, address, max_length=32):
+        """
+        Longest prefix match
+
+        :param address: IPv4 address as string or integer
+        :param max_length: ignore prefixes longer than this, used to find routes covering a whole prefix
+        :return: prefix index, or -1 if there is no matching route
+        """
+        address = int(ipaddress.IPv4Address(address))
+        index = int(numpy.searchsorted(self.starts, address, side="right")) - 1
+        while index >= 0:
+            if self.ends[index] >= address and self.lengths[index] <= max_length:
+                return index
+            index = int(self.parent[index])
+        return -1
+
+    def prefix_routes(self, index):
+        """
+        :return: dataframe with all routes (next hops) of a prefix
+        """
+        if index < 0:
+            return self.routes.iloc[0:0]
+        return self.routes.iloc[self.first_row[index]:self.first_row[index] + self.row_count[index]]
+
+    def lookup(self, address, max_length=32):
+        """
+        Which route and next hop the device uses for an address
+
+        :return: dataframe with the matching routes, empty if the address is not reachable
+        """
+        return self.prefix_routes(self.match_index(address, max_length))
+
+    def overlaps(self):
+        """
+        Overlapping and shadowed prefixes.
+        A prefix overlaps if a less specific prefix of the same device covers it, default route is not counted.
+        A prefix is shadowed if more specific prefixes cover its whole range, so it's never used for forwarding.
+
+        :return: dataframe, one row per overlapping or shadowed prefix with its closest covering prefix
+        """
+        covered = self.parent >= 0
+        covered_size = numpy.bincount(self.parent[covered], weights=self.sizes[covered], minlength=len(self))
+        shadowed = covered_size >= self.sizes
+        covered[covered] = self.lengths[self.parent[covered]] > 0
+        indexes = numpy.flatnonzero(covered | shadowed)
+        parents = self.parent[indexes]
+
+        networks = self.routes["network"].to_numpy()
+        covering_networks = numpy.where(parents >= 0, networks[self.first_row[parents]], "")
+        return pd.DataFrame(
+            {
+                "network": networks[self.first_row[indexes]],
+                "mask": self.lengths[indexes],
+                "covering_network": covering_networks,
+                "covering_mask": pd.Series(self.lengths[parents], dtype="Int64").where(parents >= 0),
+                "shadowed": shadowed[indexes],
+            }
+        )
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def lookup_devices(route_tables, address):
+    """
+    Which route and next hop every device uses for an address
+
+    :param route_tables: dictionary, device IP -> RouteTable
+    :param address: IPv4 address
+    :return: dataframe with device column and matching routes
+    """
+    results = [table.lookup(address).assign(device=device) for device, table in route_tables.items()]
+    return combine_results(results)
+
+
+def devices_reaching(route_tables, prefix):
+    """
+    Which devices have a route covering the whole prefix, including default routes
+
+    :param route_tables: dictionary, device IP -> RouteTable
+    :param prefix: IPv4 prefix, such as 10.1.2.0/24
+    :return: dataframe with device column and covering routes
+    """
+    prefix = ipaddress.IPv4Network(prefix, strict=False)
+    results = [
+        table.lookup(prefix.network_address, max_length=prefix.prefixlen).assign(device=device)
+        for device, table in route_tables.items()
+    ]
+    return combine_results(results)
+
+
+def overlapping_prefixes(route_tables):
+    """
+    Overlapping and shadowed prefixes of every device
+
+    :param route_tables: dictionary, device IP -> RouteTable
+    :return: dataframe with device column, see RouteTable.overlaps
+    """
+    return combine_results([table.overlaps().assign(device=device) for device, table in route_tables.items()])
+
+
+def combine_results(results):
+    """
+    Combines results of several devices, device column goes first
+    """
+    if not results:
+        return pd.DataFrame(columns=["device"])
+    result = pd.concat(results, ignore_index=True, sort=False)
+    return result[["device"] + [column for column in result.columns if column != "device"]]
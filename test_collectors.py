@@ -0,0 +1,468 @@
+"""
+Tests for structured data collectors, SNMP and RESTCONF collectors run against local mock agents,
+NETCONF collector runs against a mocked ncclient manager
+"""
+import base64
+import bisect
+import json
+import os
+import sys
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import collectors
+
+IF_NAME = "1.3.6.1.2.1.31.1.1.1.1"
+FDB_ADDRESS = "1.3.6.1.2.1.17.4.3.1.1"
+FDB_PORT = "1.3.6.1.2.1.17.4.3.1.2"
+FDB_STATUS = "1.3.6.1.2.1.17.4.3.1.3"
+BRIDGE_PORT_IF_INDEX = "1.3.6.1.2.1.17.1.4.1.2"
+VTP_VLAN_STATE = "1.3.6.1.4.1.9.9.46.1.3.1.1.2"
+
+COMMAND_DEFINITIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "command_definitions.json")
+
+
+def command_definition(command):
+    with open(COMMAND_DEFINITIONS) as f:
+        return next(item for item in json.load(f) if item["command"] == command)
+
+
+# -------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("0x001122aabbcc", "0011.22aa.bbcc"),
+        ("0.17.34.170.187.204", "0011.22aa.bbcc"),
+        ("00:11:22:AA:BB:CC", "0011.22aa.bbcc"),
+        ("00-11-22-aa-bb-cc", "0011.22aa.bbcc"),
+        ("0011.22aa.bbcc", "0011.22aa.bbcc"),
+        ("not a mac", "not a mac"),
+        ("0x0011", "0x0011"),
+    ],
+)
+def test_format_mac(value, expected):
+    assert collectors.format_mac(value) == expected
+
+
+def test_format_value_octets():
+    # printable bytes must not be treated as text in MAC columns
+    assert collectors.format_value(b"ABCDEF", {"format": "mac"}) == "4142.4344.4546"
+    assert collectors.format_value(b"*;L]np", {"format": "mac"}) == "2a3b.4c5d.6e70"
+    assert collectors.format_value(b"Gi1/0/1", {"source": IF_NAME}) == "Gi1/0/1"
+    assert collectors.format_value(b"\xff\xfe", {"source": IF_NAME}) == "0xfffe"
+    assert collectors.format_value(None, {}) == ""
+    assert collectors.format_value("3", {"map": {"3": "DYNAMIC"}}) == "DYNAMIC"
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def test_rows_from_snmp_tables_lookup_chain():
+    columns = {
+        "MAC": {"source": FDB_ADDRESS, "format": "mac"},
+        "Type": {"source": FDB_STATUS, "map": {"3": "DYNAMIC", "4": "SELF"}},
+        "Interface": {"source": FDB_PORT, "lookup": [BRIDGE_PORT_IF_INDEX, IF_NAME]},
+    }
+    tables = {
+        FDB_ADDRESS: {"0.17.34.170.187.204": b"\x00\x11\x22\xaa\xbb\xcc", "65.66.67.68.69.70": b"ABCDEF"},
+        FDB_PORT: {"0.17.34.170.187.204": "7", "65.66.67.68.69.70": "9"},
+        FDB_STATUS: {"0.17.34.170.187.204": "3", "65.66.67.68.69.70": "4"},
+        BRIDGE_PORT_IF_INDEX: {"7": "10107"},
+        IF_NAME: {"10107": b"Gi1/0/7"},
+    }
+    rows = collectors.rows_from_snmp_tables(["MAC", "Type", "Vlan", "Interface"], columns, tables)
+    assert rows == [
+        ["0011.22aa.bbcc", "DYNAMIC", "", "Gi1/0/7"],
+        # bridge port 9 is not in dot1dBasePortIfIndex, the bridge port number is kept
+        ["4142.4344.4546", "SELF", "", "9"],
+    ]
+
+
+def test_rows_from_snmp_tables_index_column():
+    columns = {
+        "Interface": {"source": "@index", "lookup": [IF_NAME]},
+        "Mac_From_Index": {"source": "@index", "format": "mac"},
+        "Mtu": "1.3.6.1.2.1.2.2.1.4",
+    }
+    tables = {IF_NAME: {"1": b"Gi1/0/1", "2": b"Gi1/0/2"}, "1.3.6.1.2.1.2.2.1.4": {"1": "1500", "2": "9000"}}
+    rows = collectors.rows_from_snmp_tables(["Interface", "Mtu"], columns, tables)
+    assert rows == [["Gi1/0/1", "1500"], ["Gi1/0/2", "9000"]]
+
+
+def test_rows_from_snmp_tables_vlan_column():
+    columns = {"MAC": {"source": FDB_ADDRESS, "format": "mac"}, "Vlan": "@vlan"}
+    tables = {FDB_ADDRESS: {"0.17.34.170.187.204": b"\x00\x11\x22\xaa\xbb\xcc"}}
+    assert collectors.rows_from_snmp_tables(["MAC", "Vlan"], columns, tables, "10") == [["0011.22aa.bbcc", "10"]]
+    assert collectors.rows_from_snmp_tables(["MAC", "Vlan"], columns, tables) == [["0011.22aa.bbcc", ""]]
+
+
+def test_rows_from_snmp_tables_empty():
+    assert collectors.rows_from_snmp_tables(["Mtu"], {"Mtu": "1.3.6.1.2.1.2.2.1.4"}, {}) == []
+
+
+# -------------------------------------------------------------------------------------------
+
+
+class SnmpMockInstrumentation:
+    """
+    Serves a dictionary OID -> value as MIB instrumentation of a local SNMP mock agent
+    """
+
+    def __init__(self, values, object_identifier, end_of_mib_view):
+        self.values = sorted((tuple(int(item) for item in oid.split(".")), value) for oid, value in values.items())
+        self.keys = [oid for oid, value in self.values]
+        self.object_identifier = object_identifier
+        self.end_of_mib_view = end_of_mib_view
+
+    def readNextVars(self, var_binds, ac_info=(None, None)):
+        result = []
+        for oid, value in var_binds:
+            index = bisect.bisect_right(self.keys, tuple(oid))
+            if index < len(self.values):
+                result.append((self.object_identifier(self.keys[index]), self.values[index][1]))
+            else:
+                result.append((oid, self.end_of_mib_view))
+        return result
+
+
+@pytest.fixture
+def snmp_agent():
+    """
+    Starts a local SNMP v2c agent, answers GETNEXT and GETBULK.
+    Each community, such as public or public@10 for VLAN 10, is a separate context with its own values
+    """
+    pytest.importorskip("pysnmp")
+    from pysnmp.carrier.asyncore.dgram import udp
+    from pysnmp.entity import config, engine
+    from pysnmp.entity.rfc3413 import cmdrsp, context
+    from pysnmp.proto import rfc1905
+    from pysnmp.proto.api import v2c
+
+    engines = []
+
+    def start(communities):
+        snmp_engine = engine.SnmpEngine()
+        transport = udp.UdpTransport().openServerMode(("127.0.0.1", 0))
+        config.addTransport(snmp_engine, udp.domainName, transport)
+        snmp_context = context.SnmpContext(snmp_engine)
+        for community, values in communities.items():
+            name = community.replace("@", "-")
+            config.addV1System(snmp_engine, name, community, contextName=name)
+            snmp_context.registerContextName(
+                v2c.OctetString(name), SnmpMockInstrumentation(values, v2c.ObjectIdentifier, rfc1905.endOfMibView)
+            )
+        cmdrsp.NextCommandResponder(snmp_engine, snmp_context)
+        cmdrsp.BulkCommandResponder(snmp_engine, snmp_context)
+        snmp_engine.transportDispatcher.jobStarted(1)
+        threading.Thread(target=snmp_engine.transportDispatcher.runDispatcher, daemon=True).start()
+        engines.append(snmp_engine)
+        return transport.socket.getsockname()[1]
+
+    yield start
+    for snmp_engine in engines:
+        snmp_engine.transportDispatcher.jobFinished(1)
+
+
+def snmp_command(command, port):
+    definition = command_definition(command)
+    definition["collector"] = dict(definition["collector"], port=port, timeout=1, retries=0, max_repetitions=2)
+    return definition
+
+
+def test_collect_snmp_mock_agent_if_table(snmp_agent):
+    from pysnmp.proto.api import v2c
+
+    values = {}
+    interfaces = [
+        (1, b"Gi1/0/1", b"uplink", b"ABCDEF", 2 ** 40 + 5),
+        (2, b"Gi1/0/2", b"", b"\x00\x11\x22\xaa\xbb\xcc", 7),
+    ]
+    for if_index, name, alias, address, packets in interfaces:
+        values["1.3.6.1.2.1.2.2.1.4.{}".format(if_index)] = v2c.Integer(1500)
+        values["1.3.6.1.2.1.2.2.1.6.{}".format(if_index)] = v2c.OctetString(address)
+        values["1.3.6.1.2.1.2.2.1.8.{}".format(if_index)] = v2c.Integer(if_index)
+        values["1.3.6.1.2.1.2.2.1.14.{}".format(if_index)] = v2c.Counter32(if_index * 3)
+        values["1.3.6.1.2.1.2.2.1.20.{}".format(if_index)] = v2c.Counter32(0)
+        values["1.3.6.1.2.1.31.1.1.1.1.{}".format(if_index)] = v2c.OctetString(name)
+        values["1.3.6.1.2.1.31.1.1.1.7.{}".format(if_index)] = v2c.Counter64(packets)
+        values["1.3.6.1.2.1.31.1.1.1.11.{}".format(if_index)] = v2c.Counter64(packets * 2)
+        values["1.3.6.1.2.1.31.1.1.1.15.{}".format(if_index)] = v2c.Gauge32(1000)
+        values["1.3.6.1.2.1.31.1.1.1.18.{}".format(if_index)] = v2c.OctetString(alias)
+    port = snmp_agent({"netsql": values})
+
+    rows = collectors.collect(snmp_command("snmp ifTable", port), {"host": "127.0.0.1"}, {"snmp_community": "netsql"})
+    assert rows == [
+        # printable OctetString MAC must not be shown as text, 64-bit counters are not truncated
+        ["Gi1/0/1", "up", "uplink", "4142.4344.4546", "1500", "1000", str(2 ** 40 + 5), str(2 ** 41 + 10), "3", "0"],
+        ["Gi1/0/2", "down", "", "0011.22aa.bbcc", "1500", "1000", "7", "14", "6", "0"],
+    ]
+
+
+def test_collect_snmp_mock_agent_per_vlan(snmp_agent):
+    from pysnmp.proto.api import v2c
+
+    def fdb(mac, bridge_port):
+        index = ".".join(str(octet) for octet in mac)
+        return {
+            FDB_ADDRESS + "." + index: v2c.OctetString(mac),
+            FDB_PORT + "." + index: v2c.Integer(bridge_port),
+            FDB_STATUS + "." + index: v2c.Integer(3),
+        }
+
+    vlan10 = dict(fdb(b"\x00\x11\x22\xaa\xbb\x10", 1), **{BRIDGE_PORT_IF_INDEX + ".1": v2c.Integer(10101)})
+    vlan20 = dict(fdb(b"\x00\x11\x22\xaa\xbb\x20", 2), **{BRIDGE_PORT_IF_INDEX + ".2": v2c.Integer(10102)})
+    port = snmp_agent(
+        {
+            "public": {
+                VTP_VLAN_STATE + ".1.10": v2c.Integer(1),
+                VTP_VLAN_STATE + ".1.20": v2c.Integer(1),
+                VTP_VLAN_STATE + ".1.30": v2c.Integer(2),
+                VTP_VLAN_STATE + ".1.1002": v2c.Integer(1),
+                IF_NAME + ".10101": v2c.OctetString(b"Gi1/0/1"),
+                IF_NAME + ".10102": v2c.OctetString(b"Gi1/0/2"),
+            },
+            "public@10": vlan10,
+            "public@20": vlan20,
+        }
+    )
+
+    rows = collectors.collect(snmp_command("snmp dot1dTpFdbTable", port), {"host": "127.0.0.1"}, {})
+    assert rows == [
+        ["0011.22aa.bb10", "DYNAMIC", "10", "Gi1/0/1"],
+        ["0011.22aa.bb20", "DYNAMIC", "20", "Gi1/0/2"],
+    ]
+
+
+# -------------------------------------------------------------------------------------------
+
+INTERFACES_JSON = {
+    "ietf-interfaces:interface": [
+        {
+            "name": "GigabitEthernet1",
+            "oper-status": "up",
+            "phys-address": "00:11:22:aa:bb:cc",
+            "statistics": {"in-unicast-pkts": "100", "in-errors": "2"},
+        },
+        {"name": "Loopback0", "oper-status": "up"},
+    ]
+}
+JSON_COLUMNS = {
+    "Interface": "name",
+    "Link_Status": "oper-status",
+    "Address": {"source": "phys-address", "format": "mac"},
+    "Input_Unicast_Packets": "statistics/in-unicast-pkts",
+    "Input_Errors": "statistics/in-errors",
+}
+JSON_HEADERS = ["Interface", "Link_Status", "Address", "Input_Unicast_Packets", "Input_Errors"]
+
+
+def test_rows_from_json():
+    rows = collectors.rows_from_json(JSON_HEADERS, JSON_COLUMNS, "ietf-interfaces:interface", INTERFACES_JSON)
+    assert rows == [
+        ["GigabitEthernet1", "up", "0011.22aa.bbcc", "100", "2"],
+        ["Loopback0", "up", "", "", ""],
+    ]
+
+
+def test_rows_from_json_single_record_and_missing_path():
+    single = {"ietf-interfaces:interface": {"name": "Gi1"}}
+    assert collectors.rows_from_json(["Interface"], {"Interface": "name"}, "ietf-interfaces:interface", single) == [
+        ["Gi1"]
+    ]
+    assert collectors.rows_from_json(["Interface"], {"Interface": "name"}, "missing", single) == []
+
+
+def test_rows_from_xml():
+    xml_text = """
+    <data xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+      <interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+        <interface>
+          <name>GigabitEthernet1</name>
+          <oper-status>up</oper-status>
+          <phys-address>00:11:22:aa:bb:cc</phys-address>
+          <statistics><in-unicast-pkts>100</in-unicast-pkts><in-errors> 2 </in-errors></statistics>
+        </interface>
+        <interface><name>Loopback0</name><oper-status>up</oper-status></interface>
+      </interfaces-state>
+    </data>
+    """
+    rows = collectors.rows_from_xml(JSON_HEADERS, JSON_COLUMNS, "interfaces-state/interface", xml_text)
+    assert rows == [
+        ["GigabitEthernet1", "up", "0011.22aa.bbcc", "100", "2"],
+        ["Loopback0", "up", "", "", ""],
+    ]
+
+
+# -------------------------------------------------------------------------------------------
+
+
+class RestconfMockHandler(BaseHTTPRequestHandler):
+    """
+    Local RESTCONF mock agent, answers GET for interfaces-state with basic authentication
+    """
+
+    def do_GET(self):
+        credentials = base64.b64encode(b"admin:secret").decode()
+        if self.headers.get("Authorization") != "Basic " + credentials:
+            self.send_response(401)
+            self.end_headers()
+            return
+        if self.path != "/restconf/data/ietf-interfaces:interfaces-state/interface":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(INTERFACES_JSON).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/yang-data+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def restconf_agent():
+    server = HTTPServer(("127.0.0.1", 0), RestconfMockHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def restconf_command(port):
+    return {
+        "command": "restconf interfaces-state",
+        "headers": JSON_HEADERS,
+        "collector": {
+            "type": "restconf",
+            "scheme": "http",
+            "port": port,
+            "path": "/restconf/data/ietf-interfaces:interfaces-state/interface",
+            "records": "ietf-interfaces:interface",
+            "columns": JSON_COLUMNS,
+        },
+    }
+
+
+def test_collect_restconf_mock_agent(restconf_agent):
+    device = {"host": "127.0.0.1", "username": "admin", "password": "secret", "device_type": "cisco_ios"}
+    rows = collectors.collect(restconf_command(restconf_agent), device, {})
+    assert rows == [
+        ["GigabitEthernet1", "up", "0011.22aa.bbcc", "100", "2"],
+        ["Loopback0", "up", "", "", ""],
+    ]
+
+
+def test_collect_restconf_authentication_failure(restconf_agent):
+    device = {"host": "127.0.0.1", "username": "admin", "password": "wrong", "device_type": "cisco_ios"}
+    with pytest.raises(Exception):
+        collectors.collect(restconf_command(restconf_agent), device, {})
+
+
+@pytest.mark.parametrize(
+    "verify, collector_options, verified",
+    [
+        (None, {}, True),
+        (True, {"verify_certificates": True}, True),
+        (False, {}, False),
+        (None, {"verify_certificates": False}, False),
+    ],
+)
+def test_collect_restconf_certificate_verification(monkeypatch, capsys, verify, collector_options, verified):
+    contexts = []
+
+    def urlopen(request, timeout, context):
+        contexts.append(context)
+        raise OSError("not connected")
+
+    monkeypatch.setattr(collectors.urllib.request, "urlopen", urlopen)
+    definition = restconf_command(443)
+    definition["collector"]["scheme"] = "https"
+    if verify is not None:
+        definition["collector"]["verify"] = verify
+    device = {"host": "127.0.0.1", "username": "admin", "password": "secret", "device_type": "cisco_ios"}
+    with pytest.raises(OSError):
+        collectors.collect(definition, device, collector_options)
+
+    # no context means urllib default, which verifies certificates and host names
+    if verified:
+        assert contexts == [None]
+        assert "WARNING" not in capsys.readouterr().out
+    else:
+        assert contexts[0].verify_mode == collectors.ssl.CERT_NONE
+        assert "Certificate verification is disabled for: 127.0.0.1" in capsys.readouterr().out
+
+
+# -------------------------------------------------------------------------------------------
+
+
+class NetconfMockConnection:
+    """
+    Mocked ncclient manager connection, replies to <get> with interfaces-state XML
+    """
+
+    def __init__(self, requests, **kwargs):
+        self.requests = requests
+        self.requests.append(("connect", kwargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def get(self, filter):
+        self.requests.append(("get", filter))
+        return types.SimpleNamespace(
+            data_xml="""
+            <data xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">
+              <interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+                <interface>
+                  <name>GigabitEthernet1</name>
+                  <oper-status>up</oper-status>
+                  <phys-address>00:11:22:aa:bb:cc</phys-address>
+                  <speed>1000000000</speed>
+                  <statistics>
+                    <in-unicast-pkts>18446744073709551615</in-unicast-pkts>
+                    <out-unicast-pkts>20</out-unicast-pkts>
+                    <in-errors>2</in-errors>
+                    <out-errors>0</out-errors>
+                  </statistics>
+                </interface>
+              </interfaces-state>
+            </data>
+            """
+        )
+
+
+@pytest.fixture
+def netconf_requests(monkeypatch):
+    requests = []
+    manager = types.SimpleNamespace(connect=lambda **kwargs: NetconfMockConnection(requests, **kwargs))
+    monkeypatch.setitem(sys.modules, "ncclient", types.SimpleNamespace(manager=manager))
+    return requests
+
+
+def test_collect_netconf_mocked_manager(netconf_requests):
+    device = {"host": "127.0.0.1", "username": "admin", "password": "secret", "device_type": "cisco_ios"}
+    rows = collectors.collect(command_definition("netconf interfaces-state"), device, {})
+    assert rows == [["GigabitEthernet1", "up", "0011.22aa.bbcc", "1000000000", "18446744073709551615", "20", "2", "0"]]
+
+    (connect, options), (get, subtree) = netconf_requests
+    assert options["host"] == "127.0.0.1"
+    assert options["port"] == 830
+    assert (options["username"], options["password"]) == ("admin", "secret")
+    assert subtree == ("subtree", '<interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces"/>')
+
+
+def test_collect_unknown_type():
+    with pytest.raises(RuntimeError):
+        collectors.collect({"headers": [], "collector": {"type": "telnet"}}, {"host": "127.0.0.1"}, {})
@@ -0,0 +1,384 @@
+"""
+Tests for query parsing, typed columns, filtering and raw output parsing
+"""
+import math
+import os
+
+import numpy
+import pandas as pd
+import pytest
+
+import netsql
+
+
+# -------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("never", math.inf),
+        ("Never", math.inf),
+        ("1w2d", 9 * 86400),
+        ("2d03h", 2 * 86400 + 3 * 3600),
+        ("1y2w", 365 * 86400 + 14 * 86400),
+        ("00:01:23", 83),
+        ("12:00:00", 12 * 3600),
+        ("", None),
+        ("junk", None),
+        ("1w2x", None),
+        (None, None),
+    ],
+)
+def test_durations_to_seconds(value, expected):
+    result = netsql.durations_to_seconds(pd.Series([value]))[0]
+    if expected is None:
+        assert numpy.isnan(result)
+    else:
+        assert result == expected
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("100", 100), ("2.5", 2.5), ("30d", 30 * 86400), ("never", math.inf), ("00:01:23", 83)],
+)
+def test_parse_number(value, expected):
+    assert netsql.parse_number(value) == expected
+
+
+def test_parse_number_not_a_number():
+    assert numpy.isnan(netsql.parse_number("uplink"))
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def test_command_analysis_operators():
+    query = netsql.command_analysis("select * from interfaces where Input_Errors > 0 and Last_Input > 30d")
+    assert query["source"] == "interfaces"
+    assert query["fields"] == ["*"]
+    assert query["conditions"] == [
+        {"cond_field": "Input_Errors", "cond_operator": ">", "cond_value": "0"},
+        {"cond_field": "Last_Input", "cond_operator": ">", "cond_value": "30d"},
+    ]
+
+    # and / or are split on whole words only, Bandwidth and Description contain them
+    query = netsql.command_analysis("select * from interfaces where Bandwidth > 100000 and Description = Force10 or core")
+    assert query["conditions"] == [
+        {"cond_field": "Bandwidth", "cond_operator": ">", "cond_value": "100000"},
+        {"cond_field": "Description", "cond_operator": "=", "cond_value": ["Force10", "core"]},
+    ]
+
+
+@pytest.mark.parametrize("cond_operator", ["=", "!=", ">", ">=", "<", "<="])
+def test_command_analysis_each_operator(cond_operator):
+    query = netsql.command_analysis("select Interface from interfaces where Mtu {} 1500".format(cond_operator))
+    assert query["conditions"] == [{"cond_field": "Mtu", "cond_operator": cond_operator, "cond_value": "1500"}]
+    assert query["fields"] == ["Interface", "Mtu"]
+
+
+def test_check_conditions():
+    assert netsql.check_conditions([{"cond_field": "Mtu", "cond_operator": ">", "cond_value": "1500"}]) == ""
+    assert netsql.check_conditions([{"cond_field": "Name", "cond_operator": "=", "cond_value": "uplink"}]) == ""
+    assert netsql.check_conditions([{"cond_field": "Name", "cond_operator": ">", "cond_value": "uplink"}])
+    assert netsql.check_conditions([{"cond_field": "Mtu", "cond_operator": ">=", "cond_value": ["1500", "x"]}])
+
+
+@pytest.mark.parametrize(
+    "route_option, message",
+    [("--route-lookup=garbage", "Invalid route query"), ("--route-reach=10.1.0.0/33", "Invalid route query")],
+)
+def test_main_rejects_invalid_route_query(monkeypatch, capsys, route_option, message):
+    # checked before the password prompt and the device loop
+    args = ["--query=select * from routes", "--source=10.0.0.1", "--user=admin", "--no-connect", route_option]
+    parse_args = netsql.parse_args
+    monkeypatch.setattr(netsql, "parse_args", lambda: parse_args(args))
+    monkeypatch.setattr(netsql.getpass, "getpass", pytest.fail)
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
+    with pytest.raises(SystemExit) as error:
+        netsql.main()
+    assert error.value.code == 1
+    assert message in capsys.readouterr().out
+
+
+# -------------------------------------------------------------------------------------------
+
+
+@pytest.fixture
+def typed():
+    return netsql.typed_column(pd.Series(["0", "5", None, "12"]), "int")
+
+
+@pytest.mark.parametrize(
+    "cond_operator, cond_value, expected",
+    [
+        ("=", "5", [False, True, False, False]),
+        ("!=", "5", [True, False, False, True]),
+        (">", "0", [False, True, False, True]),
+        (">=", "5", [False, True, False, True]),
+        ("<", "5", [True, False, False, False]),
+        ("<=", "5", [True, True, False, False]),
+    ],
+)
+def test_filter_mask_typed(typed, cond_operator, cond_value, expected):
+    assert netsql.filter_mask(typed, cond_operator, cond_value, True).tolist() == expected
+
+
+def test_filter_mask_typed_durations():
+    column = netsql.typed_column(pd.Series(["never", "00:01:23", "5w1d", "junk"]), "duration")
+    assert netsql.filter_mask(column, "=", "never", True).tolist() == [True, False, False, False]
+    assert netsql.filter_mask(column, ">", "30d", True).tolist() == [True, False, True, False]
+    assert netsql.filter_mask(column, "!=", "never", True).tolist() == [False, True, True, False]
+
+
+@pytest.mark.parametrize(
+    "cond_operator, cond_value, expected",
+    [
+        ("=", "uplink", [True, False, False]),
+        ("!=", "uplink", [False, True, True]),
+        ("=", "link", [True, False, False]),
+    ],
+)
+def test_filter_mask_untyped_text(cond_operator, cond_value, expected):
+    column = pd.Series(["uplink", "down", None])
+    assert netsql.filter_mask(column, cond_operator, cond_value).tolist() == expected
+
+
+def test_filter_mask_untyped_numbers():
+    # untyped = is still a substring match, Vlan = 80 matches 180
+    column = pd.Series([80, 180, 8])
+    assert netsql.filter_mask(column, "=", "80").tolist() == [True, True, False]
+    assert netsql.filter_mask(column, "!=", "80").tolist() == [False, False, True]
+    assert netsql.filter_mask(column, ">", "79").tolist() == [True, True, False]
+    # untyped text column with some numbers, non-numeric cells never match
+    column = pd.Series(["10", "routed", "30"])
+    assert netsql.filter_mask(column, ">=", "20").tolist() == [False, False, True]
+
+
+def test_filter_mask_rejects_non_numeric_comparison():
+    with pytest.raises(ValueError):
+        netsql.filter_mask(pd.Series(["uplink"]), ">", "uplink")
+
+
+def test_filter_mask_or_list(typed):
+    assert netsql.filter_mask(typed, ">=", ["12", "5"], True).tolist() == [False, True, False, True]
+    assert netsql.filter_mask(typed, "=", ["0", "12"], True).tolist() == [True, False, False, True]
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def test_process_csv_files_keeps_original_values(tmp_path):
+    interfaces = tmp_path / "show_interface.csv"
+    pd.DataFrame(
+        {
+            "Interface": ["Gi1/0/1", "Gi1/0/2", "Gi1/0/3"],
+            "Last_Input": ["never", "00:01:23", "5w1d"],
+            "Input_Errors": [0, 3, 7],
+        }
+    ).to_csv(interfaces, index=False)
+    report = tmp_path / "reports" / "interfaces_report.csv"
+    column_types = [{"Last_Input": "duration", "Input_Errors": "int"}, {}]
+
+    netsql.process_csv_files(
+        False,
+        ["NA"],
+        ["Interface", "Last_Input"],
+        [{"cond_field": "Last_Input", "cond_operator": ">", "cond_value": "30d"}],
+        str(interfaces),
+        "",
+        str(report),
+        column_types,
+    )
+    result = pd.read_csv(report, index_col=0)
+    assert result.columns.tolist() == ["Interface", "Last_Input"]
+    assert result["Last_Input"].tolist() == ["never", "5w1d"]
+
+    netsql.process_csv_files(
+        False,
+        ["NA"],
+        ["*"],
+        [
+            {"cond_field": "Last_Input", "cond_operator": "=", "cond_value": "never"},
+        ],
+        str(interfaces),
+        "",
+        str(report),
+        column_types,
+    )
+    result = pd.read_csv(report, index_col=0)
+    assert result.columns.tolist() == ["Interface", "Last_Input", "Input_Errors"]
+    assert result["Interface"].tolist() == ["Gi1/0/1"]
+
+
+@pytest.mark.parametrize(
+    "cond_field, cond_value, expected",
+    [
+        ("Last_Input", "00:01", ["Gi1/0/2"]),
+        ("Bandwidth", "Kbit", ["Gi1/0/1", "Gi1/0/2", "Gi1/0/3"]),
+        ("Bandwidth", "100000", ["Gi1/0/2"]),
+        ("Input_Errors", "abc", []),
+        ("Last_Input", ["never", "5w1d"], ["Gi1/0/1", "Gi1/0/3"]),
+    ],
+)
+def test_process_csv_files_text_value_on_typed_field(tmp_path, cond_field, cond_value, expected):
+    # = with a value which is not a number or duration is a substring match on the original text
+    interfaces = tmp_path / "show_interface.csv"
+    pd.DataFrame(
+        {
+            "Interface": ["Gi1/0/1", "Gi1/0/2", "Gi1/0/3"],
+            "Last_Input": ["never", "00:01:23", "5w1d"],
+            "Bandwidth": ["1000000 Kbit", "100000 Kbit", "10000 Kbit"],
+            "Input_Errors": [0, 3, 7],
+        }
+    ).to_csv(interfaces, index=False)
+    report = tmp_path / "reports" / "interfaces_report.csv"
+    column_types = [{"Last_Input": "duration", "Bandwidth": "int", "Input_Errors": "int"}, {}]
+
+    netsql.process_csv_files(
+        False,
+        ["NA"],
+        ["*"],
+        [{"cond_field": cond_field, "cond_operator": "=", "cond_value": cond_value}],
+        str(interfaces),
+        "",
+        str(report),
+        column_types,
+    )
+    assert pd.read_csv(report, index_col=0)["Interface"].tolist() == expected
+
+
+# -------------------------------------------------------------------------------------------
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+ROUTE_TEMPLATE = os.path.join(TEMPLATE_DIR, "cisco_ios_show_ip_route.template")
+ARP_TEMPLATE = os.path.join(TEMPLATE_DIR, "cisco_ios_show_ip_arp.template")
+
+
+def route_output():
+    lines = ["Codes: L - local, C - connected, S - static", "", "Gateway of last resort is 10.0.0.1 to network 0.0.0.0", ""]
+    lines.append("S*    0.0.0.0/0 [1/0] via 10.0.0.1")
+    for a in range(3):
+        lines.append("      10.{}.0.0/16 is variably subnetted, 9 subnets, 2 masks".format(a))
+        for b in range(9):
+            if b % 3 == 0:
+                lines.append("C        10.{}.{}.0/24 is directly connected, GigabitEthernet1/0/{}".format(a, b, b))
+            elif b % 3 == 1:
+                # load-balanced route, next hops on separate lines
+                lines.append("O        10.{}.{}.0/24 [110/{}] via 10.0.0.{}, 1w2d, TenGigabitEthernet1/1/1".format(a, b, b, b))
+                lines.append("                   [110/{}] via 10.0.0.{}, 1w2d, Te1/1/2".format(b, b + 1))
+            else:
+                # network on the line above, mask filled down from "is subnetted" line
+                lines.append("D        10.{}.{}.0".format(a, b))
+                lines.append("           [90/3072] via 10.0.1.1, 00:01:23, Vlan10")
+    return "\n".join(lines) + "\n"
+
+
+def arp_output(extra_line=""):
+    lines = ["Protocol  Address          Age (min)  Hardware Addr   Type   Interface"]
+    for i in range(20):
+        lines.append("Internet  10.1.1.{:<3}        {:<3}   0011.22aa.bb{:02x}  ARPA   Vlan10".format(i, i, i))
+        if i == 15 and extra_line:
+            lines.append(extra_line)
+    return "\n".join(lines) + "\n"
+
+
+def parse_in_chunks(template, file_name, batch_size, chunk_size):
+    with open(template) as template_file:
+        text_fsm_template = netsql.textfsm.TextFSM(template_file)
+    with open(file_name, "rb") as content_file:
+        return list(netsql.parse_raw_output(text_fsm_template, content_file, batch_size, chunk_size))
+
+
+def parse_whole_text(template, text):
+    with open(template) as template_file:
+        return netsql.textfsm.TextFSM(template_file).ParseText(text)
+
+
+@pytest.mark.parametrize("template, output", [(ROUTE_TEMPLATE, route_output()), (ARP_TEMPLATE, arp_output())])
+@pytest.mark.parametrize("batch_size, chunk_size", [(1, 1), (3, 7), (5, 64), (10000, 1024 * 1024)])
+def test_parse_raw_output_chunks_match_whole_text(tmp_path, template, output, batch_size, chunk_size):
+    file_name = tmp_path / "raw.txt"
+    file_name.write_bytes(output.encode())
+
+    batches = parse_in_chunks(template, file_name, batch_size, chunk_size)
+    expected = parse_whole_text(template, output)
+
+    assert len(expected) > 10
+    assert [row for batch in batches for row in batch] == expected
+    assert all(0 < len(batch) <= batch_size for batch in batches)
+
+
+def test_parse_raw_output_error_rule(tmp_path):
+    output = arp_output("this line is not ARP output")
+    file_name = tmp_path / "raw.txt"
+    file_name.write_bytes(output.encode())
+
+    with pytest.raises(netsql.textfsm.TextFSMError):
+        parse_whole_text(ARP_TEMPLATE, output)
+    with pytest.raises(netsql.textfsm.TextFSMError):
+        parse_in_chunks(ARP_TEMPLATE, file_name, 2, 16)
+
+
+def test_parse_raw_output_empty_file(tmp_path):
+    file_name = tmp_path / "raw.txt"
+    file_name.write_bytes(b"")
+    assert parse_in_chunks(ROUTE_TEMPLATE, file_name, 10, 10) == []
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def test_print_to_csv_file_normalises_rows(tmp_path):
+    file_name = str(tmp_path / "out.csv")
+    assert netsql.print_to_csv_file(["a", "b"], iter([["GigabitEthernet1/0/1", ["Te1/1/1"]]]), file_name)
+    with open(file_name) as f:
+        assert f.read().splitlines() == ["a,b", "Gi1/0/1,['TenGi1/1/1']"]
+
+
+def test_print_to_csv_file_failure_keeps_previous_file(tmp_path):
+    file_name = tmp_path / "out.csv"
+    file_name.write_text("a,b\nprevious,run\n")
+
+    def failing_rows():
+        yield ["Gi1/0/1", "x"]
+        raise netsql.textfsm.TextFSMError("parse failed")
+
+    assert not netsql.print_to_csv_file(["a", "b"], failing_rows(), str(file_name))
+    assert file_name.read_text() == "a,b\nprevious,run\n"
+    assert not (tmp_path / "out.csv.tmp").exists()
+
+
+@pytest.fixture
+def arp_command(tmp_path, monkeypatch):
+    """
+    Points raw output files to tmp_path and defines show ip arp command
+    """
+    monkeypatch.setattr(
+        netsql, "get_file_path", lambda host, command, file_type: str(tmp_path / command.replace(" ", "_"))
+    )
+    monkeypatch.setattr(
+        netsql,
+        "command_definitions",
+        [{"command": "show ip arp", "template": ARP_TEMPLATE, "headers": ["Protocol", "Ip_Address", "Age", "MAC", "Type", "Interface"]}],
+        raising=False,
+    )
+    monkeypatch.setattr(netsql, "RAW_OUTPUT_ENCODING", "utf-8")
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "output, converted",
+    [
+        (arp_output().encode(), True),
+        (arp_output("this line is not ARP output").encode(), False),
+        (arp_output().encode() + b"Internet  10.1.1.99  0  \xff\xfe  ARPA  Vlan10\n", False),
+    ],
+)
+def test_convert_output_to_csv(arp_command, output, converted):
+    (arp_command / "show_ip_arp.txt").write_bytes(output)
+
+    assert netsql.convert_output_to_csv(["show ip arp"], {"host": "10.0.0.1"}) == converted
+    assert (arp_command / "show_ip_arp.csv").exists() == converted
+    if converted:
+        assert len(pd.read_csv(arp_command / "show_ip_arp.csv")) == 20
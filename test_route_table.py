@@ -0,0 +1,176 @@
+"""
+Tests for route table engine
+"""
+import ipaddress
+import random
+
+import pandas as pd
+import pytest
+
+import route_table
+
+HEADERS = ["protocol", "type", "network", "mask", "distance", "metric", "nexthop_ip", "nexthop_if", "uptime"]
+
+
+def routes(*rows):
+    """
+    Builds "show ip route" dataframe from (protocol, network, mask, nexthop_ip) tuples
+    """
+    return pd.DataFrame(
+        [[protocol, "", network, mask, "", "", nexthop_ip, "", ""] for protocol, network, mask, nexthop_ip in rows],
+        columns=HEADERS,
+    )
+
+
+@pytest.fixture
+def table():
+    return route_table.RouteTable(
+        routes(
+            ("S", "0.0.0.0", 0, "192.0.2.1"),
+            ("C", "10.1.0.0", 16, ""),
+            ("O", "10.1.2.0", 24, "10.1.0.2"),
+            ("O", "10.1.2.0", 24, "10.1.0.3"),
+            ("O", "10.1.2.0", 25, "10.1.0.4"),
+            ("O", "10.1.2.128", 25, "10.1.0.5"),
+            ("D", "10.1.3.0", 24, "10.1.0.6"),
+        )
+    )
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def test_longest_prefix_match(table):
+    assert table.lookup("10.1.2.3")[["network", "mask"]].values.tolist() == [["10.1.2.0", 25]]
+    assert table.lookup("10.1.2.200")["nexthop_ip"].tolist() == ["10.1.0.5"]
+    assert table.lookup("10.1.3.1")["nexthop_ip"].tolist() == ["10.1.0.6"]
+    assert table.lookup("10.1.9.9")[["network", "mask"]].values.tolist() == [["10.1.0.0", 16]]
+    assert table.lookup("8.8.8.8")[["network", "mask"]].values.tolist() == [["0.0.0.0", 0]]
+
+
+def test_ecmp_routes_grouped(table):
+    # 10.1.2.0/24 is only used as covering prefix for /25s, lookup it with max_length
+    ecmp = table.lookup("10.1.2.0", max_length=24)
+    assert ecmp["nexthop_ip"].tolist() == ["10.1.0.2", "10.1.0.3"]
+    assert len(table) == 6
+
+
+def test_no_route():
+    table = route_table.RouteTable(routes(("C", "10.1.0.0", 16, "")))
+    assert table.lookup("192.168.1.1").empty
+    assert table.match_index("192.168.1.1") == -1
+    assert table.match_index("9.255.255.255") == -1
+
+
+def test_classful_mask_fallback():
+    table = route_table.RouteTable(
+        routes(("C", "10.0.0.0", None, ""), ("C", "172.16.0.0", None, ""), ("C", "192.168.1.0", None, ""))
+    )
+    assert table.lengths.tolist() == [8, 16, 24]
+    assert table.lookup("172.16.200.1")["network"].tolist() == ["172.16.0.0"]
+
+
+def test_invalid_rows_ignored():
+    table = route_table.RouteTable(routes(("C", "not an address", 24, ""), ("C", "10.1.0.0", 40, "")))
+    assert len(table) == 0
+
+
+def test_empty_table():
+    table = route_table.RouteTable(pd.DataFrame(columns=HEADERS))
+    assert len(table) == 0
+    assert table.lookup("10.1.1.1").empty
+    assert table.overlaps().empty
+    assert table.match_index(1) == -1
+
+
+def test_from_csv(tmp_path, table):
+    file_name = tmp_path / "show_ip_route.csv"
+    table.routes.to_csv(file_name, index=False)
+    loaded = route_table.RouteTable.from_csv(file_name)
+    assert loaded.lookup("10.1.2.3")["nexthop_ip"].tolist() == ["10.1.0.4"]
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def test_overlaps_and_shadowed(table):
+    overlaps = table.overlaps().set_index(["network", "mask"])
+    # 10.1.0.0/16 is covered by default route only, it's not reported
+    assert ("10.1.0.0", 16) not in overlaps.index
+    # 10.1.2.0/24 is fully covered by two /25s
+    assert bool(overlaps.loc[("10.1.2.0", 24), "shadowed"])
+    assert overlaps.loc[("10.1.2.0", 24), "covering_network"] == "10.1.0.0"
+    assert not overlaps.loc[("10.1.2.0", 25), "shadowed"]
+    assert overlaps.loc[("10.1.2.128", 25), "covering_mask"] == 24
+    assert not overlaps.loc[("10.1.3.0", 24), "shadowed"]
+    assert len(overlaps) == 4
+
+
+def test_shadowed_without_covering_prefix():
+    table = route_table.RouteTable(
+        routes(("S", "10.0.0.0", 8, "1.1.1.1"), ("S", "10.0.0.0", 9, "1.1.1.2"), ("S", "10.128.0.0", 9, "1.1.1.3"))
+    )
+    overlaps = table.overlaps().set_index(["network", "mask"])
+    assert bool(overlaps.loc[("10.0.0.0", 8), "shadowed"])
+    assert overlaps.loc[("10.0.0.0", 8), "covering_network"] == ""
+    assert pd.isna(overlaps.loc[("10.0.0.0", 8), "covering_mask"])
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def test_devices(table):
+    tables = {"r1": table, "r2": route_table.RouteTable(routes(("C", "10.1.2.0", 24, "")))}
+
+    result = route_table.lookup_devices(tables, "10.1.2.3")
+    assert result.columns[0] == "device"
+    assert result[["device", "network", "mask"]].values.tolist() == [["r1", "10.1.2.0", 25], ["r2", "10.1.2.0", 24]]
+
+    # r2 has only a /24, it doesn't cover the whole /16
+    result = route_table.devices_reaching(tables, "10.1.0.0/16")
+    assert result[["device", "network", "mask"]].values.tolist() == [["r1", "10.1.0.0", 16]]
+
+    # for /24, r1 uses the /24 routes, not the more specific /25s
+    result = route_table.devices_reaching(tables, "10.1.2.0/24")
+    assert result[["device", "nexthop_ip"]].values.tolist() == [["r1", "10.1.0.2"], ["r1", "10.1.0.3"], ["r2", ""]]
+
+    # default route covers everything
+    result = route_table.devices_reaching(tables, "198.51.100.0/24")
+    assert result["device"].tolist() == ["r1"]
+
+    result = route_table.overlapping_prefixes(tables)
+    assert set(result["device"]) == {"r1"}
+
+    with pytest.raises(ValueError):
+        route_table.devices_reaching(tables, "10.1.0.0/33")
+
+
+# -------------------------------------------------------------------------------------------
+
+
+def brute_force_match(networks, address):
+    matches = [network for network in networks if address in network]
+    return max(matches, key=lambda network: network.prefixlen) if matches else None
+
+
+def test_match_against_brute_force():
+    generator = random.Random(7)
+    networks = {
+        ipaddress.IPv4Network((generator.getrandbits(32), generator.randint(4, 30)), strict=False) for _ in range(2000)
+    }
+    # nested prefixes around a few addresses
+    for length in range(8, 31, 2):
+        networks.add(ipaddress.IPv4Network(("10.20.30.40", length), strict=False))
+    networks = sorted(networks)
+    table = route_table.RouteTable(
+        routes(*[("S", str(network.network_address), network.prefixlen, "") for network in networks])
+    )
+
+    addresses = [generator.getrandbits(32) for _ in range(500)] + [int(ipaddress.IPv4Address("10.20.30.40"))]
+    for address in addresses:
+        expected = brute_force_match(networks, ipaddress.IPv4Address(address))
+        index = table.match_index(address)
+        if expected is None:
+            assert index == -1
+        else:
+            assert (table.starts[index], table.lengths[index]) == (int(expected.network_address), expected.prefixlen)